@@ -7,12 +7,25 @@ Auto-refreshes Trakt tokens
 
 import os
 import time
+import threading
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from zoneinfo import ZoneInfo
 from datetime import datetime, timedelta, timezone
 import logging
-import pytz
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 import psycopg2
 from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 # Configuration
 TRAKT_CLIENT_ID = os.getenv("TRAKT_CLIENT_ID")
@@ -24,67 +37,224 @@ TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "3600"))  # 1 hour default
 LOOKBACK_HOURS = int(os.getenv("LOOKBACK_HOURS", "24"))  # 24 hours default
 DATABASE_URL = os.getenv("DATABASE_URL")  # PostgreSQL connection string
+TMDB_WORKERS = 8  # Concurrent TMDB lookups per check
+TMDB_CACHE_SECONDS = 86400  # How long TMDB metadata stays cached
+CLEANUP_SECONDS = 86400  # Prune old posted history daily
+MAX_CATCHUP_DAYS = 30  # Posted history retention; also the oldest watch fetched
 
 # Timezone configuration
-IST = pytz.timezone("Asia/Kolkata")
+IST = ZoneInfo("Asia/Kolkata")
+WATCHED_FORMAT = "%b %d, %Y at %I:%M %p IST"
+
+# Embed building blocks shared by every post
+TRAKT_URL = "https://trakt.tv"
+TRAKT_ICON_URL = "https://i.ibb.co/6JbfjSKn/Trakt-TV.png"
+TMDB_W500 = "https://image.tmdb.org/t/p/w500"
+TMDB_ORIGINAL = "https://image.tmdb.org/t/p/original"
+EMBED_FOOTER = {"text": "Trakt  •  Infuse", "icon_url": TRAKT_ICON_URL}
+MOVIE_AUTHOR = {"name": "Movie 🎬", "icon_url": TRAKT_ICON_URL}
+
+# Static parts of each embed; only "fields" is mutated per post, so it is
+# always created fresh
+MOVIE_EMBED = {"author": MOVIE_AUTHOR, "footer": EMBED_FOOTER}
+EPISODE_EMBED = {"footer": EMBED_FOOTER}
+
+# Embed colors by genre (first matching genre wins)
+GENRE_COLORS = {
+    "Action": 0xFF4444,
+    "Adventure": 0xFF8C00,
+    "Animation": 0xFF69B4,
+    "Comedy": 0xFFD700,
+    "Crime": 0x8B0000,
+    "Documentary": 0x4682B4,
+    "Drama": 0x9370DB,
+    "Fantasy": 0x9400D3,
+    "Horror": 0x8B0000,
+    "Mystery": 0x483D8B,
+    "Romance": 0xFF1493,
+    "Sci-Fi": 0x00CED1,
+    "Thriller": 0xDC143C,
+}
+
+# Embed colors by rating: RATING_COLORS[i] applies below RATING_THRESHOLDS[i]
+RATING_THRESHOLDS = (5, 6, 7, 7.5, 8, 9)
+RATING_COLORS = (
+    0xFF4444,  # Red
+    0xFF69B4,  # Hot Pink (5+)
+    0xFF6B9D,  # Pink (6+)
+    0xFFA500,  # Orange (7+)
+    0xFFD700,  # Gold (7.5+)
+    0x00FF88,  # Vibrant Green (8+)
+    0x00D9FF,  # Brilliant Cyan (9+)
+)
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
 )
 logger = logging.getLogger("trakt-tracker")
 
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Discord allows 10 embeds and 6000 embed characters per webhook message
+DISCORD_MAX_EMBEDS = 10
+DISCORD_MAX_EMBED_CHARS = 6000
+
+# TMDB query parameters, built once and passed to requests as params=
+TMDB_API_URL = "https://api.themoviedb.org/3"
+TMDB_PARAMS = {"api_key": TMDB_API_KEY}
+TMDB_CREDITS_PARAMS = {**TMDB_PARAMS, "append_to_response": "credits"}
+
+
+class HTTPRetry(Retry):
+    """Retry GETs on transient errors, POSTs only when told to via Retry-After
+
+    A POST that hit a 5xx or a read timeout may already have been processed,
+    so retrying it could duplicate a Discord message or spend a Trakt refresh
+    token. A 429 with Retry-After is a guaranteed rejection and safe to resend.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == "POST":
+            return bool(self.total and status_code == 429 and has_retry_after)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+# Shared HTTP session so connections to Trakt, TMDB and Discord are reused
+SESSION = requests.Session()
+SESSION.headers["User-Agent"] = "Discord-Trakt-Notifications"
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=HTTPRetry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+        ),
+    ),
+)
+
+# Static Trakt API headers; Authorization is added per request
+TRAKT_HEADERS = {
+    "Content-Type": "application/json",
+    "trakt-api-version": "2",
+    "trakt-api-key": TRAKT_CLIENT_ID,
+}
+
 # Global token variables
 current_access_token = TRAKT_ACCESS_TOKEN
 current_refresh_token = TRAKT_REFRESH_TOKEN
 token_expires_at = None
 
+# Validators from the last Trakt history response
+trakt_etag = None
+trakt_last_modified = None
+
+# watched_at of the newest fully handled history item
+trakt_cursor = None
+
+# Database connection pool (created on first use)
+db_pool = None
+DB_POOL_LOCK = threading.Lock()
+
+# TMDB responses (movies, shows, episodes), expired after TMDB_CACHE_SECONDS
+TMDB_CACHE = TTLCache(maxsize=1024, ttl=TMDB_CACHE_SECONDS)
+TMDB_CACHE_LOCK = threading.Lock()
+
+# Background worker for checks; the lock keeps runs from overlapping
+CHECK_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+CHECK_LOCK = threading.Lock()
+
+
+def get_db_pool():
+    """Return the connection pool, creating it if needed"""
+    global db_pool
+
+    with DB_POOL_LOCK:
+        if db_pool is None:
+            db_pool = ThreadedConnectionPool(1, 4, DATABASE_URL)
+        return db_pool
 
-def get_db_connection():
-    """Get PostgreSQL database connection"""
+
+@contextmanager
+def db_conn():
+    """Borrow a PostgreSQL connection from the pool"""
+    pool = get_db_pool()
+    conn = pool.getconn()
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
-    except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return None
+        yield conn
+    except psycopg2.OperationalError:
+        # Server restarted or idle connection timed out - drop only this
+        # connection; the pool opens a fresh one when it next runs short
+        pool.putconn(conn, close=True)
+        logger.warning("⚠️  Lost database connection - it will be replaced")
+        raise
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn, close=bool(conn.closed))
+        raise
+    else:
+        pool.putconn(conn, close=bool(conn.closed))
 
 
 def init_database():
-    """Initialize database table"""
-    conn = get_db_connection()
-    if not conn:
+    """Create the connection pool and initialize database tables"""
+    try:
+        get_db_pool()
+    except Exception as e:
+        logger.error(f"Database connection error: {e}")
         logger.error("Failed to connect to database!")
         return False
 
     try:
-        cur = conn.cursor()
-
-        # Table for posted history
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS posted_history (
-                trakt_id BIGINT PRIMARY KEY,
-                posted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """
-        )
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                # Table for posted history
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS posted_history (
+                        trakt_id BIGINT PRIMARY KEY,
+                        posted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """
+                )
 
-        # Table for storing tokens
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS trakt_tokens (
-                id INTEGER PRIMARY KEY DEFAULT 1,
-                access_token TEXT NOT NULL,
-                refresh_token TEXT NOT NULL,
-                expires_at TIMESTAMP NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """
-        )
+                # BRIN index keeps the time-based cleanup off a full table scan
+                cur.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS posted_history_posted_at_idx
+                    ON posted_history USING BRIN (posted_at)
+                """
+                )
+
+                # Table for storing tokens
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS trakt_tokens (
+                        id INTEGER PRIMARY KEY DEFAULT 1,
+                        access_token TEXT NOT NULL,
+                        refresh_token TEXT NOT NULL,
+                        expires_at TIMESTAMP NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """
+                )
+
+                # Trakt history validators and watermark, so they survive restarts
+                cur.execute(
+                    """
+                    ALTER TABLE trakt_tokens
+                    ADD COLUMN IF NOT EXISTS history_etag TEXT,
+                    ADD COLUMN IF NOT EXISTS history_last_modified TEXT,
+                    ADD COLUMN IF NOT EXISTS trakt_cursor TIMESTAMPTZ
+                """
+                )
 
-        conn.commit()
-        cur.close()
-        conn.close()
+            conn.commit()
         logger.info("✅ Database initialized")
         return True
     except Exception as e:
@@ -94,32 +264,27 @@ def init_database():
 
 def save_tokens_to_db(access_token, refresh_token, expires_in):
     """Save tokens to database"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-
     try:
         expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
-        cur = conn.cursor()
-
-        # Insert or update tokens
-        cur.execute(
-            """
-            INSERT INTO trakt_tokens (id, access_token, refresh_token, expires_at, updated_at)
-            VALUES (1, %s, %s, %s, CURRENT_TIMESTAMP)
-            ON CONFLICT (id) 
-            DO UPDATE SET 
-                access_token = EXCLUDED.access_token,
-                refresh_token = EXCLUDED.refresh_token,
-                expires_at = EXCLUDED.expires_at,
-                updated_at = CURRENT_TIMESTAMP
-        """,
-            (access_token, refresh_token, expires_at),
-        )
 
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                # Insert or update tokens
+                cur.execute(
+                    """
+                    INSERT INTO trakt_tokens (id, access_token, refresh_token, expires_at, updated_at)
+                    VALUES (1, %s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (id) 
+                    DO UPDATE SET 
+                        access_token = EXCLUDED.access_token,
+                        refresh_token = EXCLUDED.refresh_token,
+                        expires_at = EXCLUDED.expires_at,
+                        updated_at = CURRENT_TIMESTAMP
+                """,
+                    (access_token, refresh_token, expires_at),
+                )
+            conn.commit()
+
         logger.info("✅ Tokens saved to database")
         return True
     except Exception as e:
@@ -129,22 +294,18 @@ def save_tokens_to_db(access_token, refresh_token, expires_in):
 
 def load_tokens_from_db():
     """Load tokens from database"""
-    conn = get_db_connection()
-    if not conn:
-        return None
-
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT access_token, refresh_token, expires_at 
-            FROM trakt_tokens 
-            WHERE id = 1
-        """
-        )
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT access_token, refresh_token, expires_at,
+                           history_etag, history_last_modified, trakt_cursor
+                    FROM trakt_tokens 
+                    WHERE id = 1
+                """
+                )
+                result = cur.fetchone()
 
         if result:
             # Make sure expires_at is timezone-aware
@@ -156,6 +317,9 @@ def load_tokens_from_db():
                 "access_token": result[0],
                 "refresh_token": result[1],
                 "expires_at": expires_at,
+                "history_etag": result[3],
+                "history_last_modified": result[4],
+                "trakt_cursor": result[5],
             }
         return None
     except Exception as e:
@@ -178,21 +342,23 @@ def refresh_trakt_token():
     logger.info("🔄 Refreshing Trakt access token...")
 
     try:
-        response = requests.post(
+        response = SESSION.post(
             "https://api.trakt.tv/oauth/token",
-            json={
-                "refresh_token": current_refresh_token,
-                "client_id": TRAKT_CLIENT_ID,
-                "client_secret": TRAKT_CLIENT_SECRET,
-                "redirect_uri": "urn:ietf:wg:oauth:2.0:oob",
-                "grant_type": "refresh_token",
-            },
-            headers={"Content-Type": "application/json"},
+            data=orjson.dumps(
+                {
+                    "refresh_token": current_refresh_token,
+                    "client_id": TRAKT_CLIENT_ID,
+                    "client_secret": TRAKT_CLIENT_SECRET,
+                    "redirect_uri": "urn:ietf:wg:oauth:2.0:oob",
+                    "grant_type": "refresh_token",
+                }
+            ),
+            headers=JSON_HEADERS,
             timeout=15,
         )
 
         if response.ok:
-            token_data = response.json()
+            token_data = orjson.loads(response.content)
             current_access_token = token_data["access_token"]
             current_refresh_token = token_data["refresh_token"]
             token_expires_at = datetime.now(timezone.utc) + timedelta(
@@ -219,26 +385,29 @@ def refresh_trakt_token():
         return False
 
 
-def ensure_valid_token():
-    """Ensure we have a valid token, refresh if needed"""
+def load_tokens():
+    """Load tokens from the database, seeding it from env on first run"""
     global current_access_token, current_refresh_token, token_expires_at
+    global trakt_etag, trakt_last_modified, trakt_cursor
+
+    db_tokens = load_tokens_from_db()
+    if db_tokens:
+        current_access_token = db_tokens["access_token"]
+        current_refresh_token = db_tokens["refresh_token"]
+        token_expires_at = db_tokens["expires_at"]
+        trakt_etag = db_tokens["history_etag"]
+        trakt_last_modified = db_tokens["history_last_modified"]
+        trakt_cursor = db_tokens["trakt_cursor"]
+        logger.info("📂 Loaded tokens from database")
+    elif current_access_token and current_refresh_token:
+        # Assume token expires in 6 days (default from Trakt)
+        save_tokens_to_db(current_access_token, current_refresh_token, 518400)
+        token_expires_at = datetime.now(timezone.utc) + timedelta(days=6)
+        logger.info("📝 Initialized tokens in database")
 
-    # Try to load tokens from database first
-    if not current_access_token or not token_expires_at:
-        db_tokens = load_tokens_from_db()
-        if db_tokens:
-            current_access_token = db_tokens["access_token"]
-            current_refresh_token = db_tokens["refresh_token"]
-            token_expires_at = db_tokens["expires_at"]
-            logger.info("📂 Loaded tokens from database")
-        else:
-            # Initialize database with env tokens
-            if current_access_token and current_refresh_token:
-                # Assume token expires in 6 days (default from Trakt)
-                save_tokens_to_db(current_access_token, current_refresh_token, 518400)
-                token_expires_at = datetime.now(timezone.utc) + timedelta(days=6)
-                logger.info("📝 Initialized tokens in database")
 
+def ensure_valid_token():
+    """Ensure we have a valid token, refresh if needed"""
     # Check if token needs refresh (refresh 1 day before expiry)
     if token_expires_at:
         time_until_expiry = token_expires_at - datetime.now(timezone.utc)
@@ -255,39 +424,49 @@ def ensure_valid_token():
     return True
 
 
-def is_posted(trakt_id):
-    """Check if item has already been posted"""
-    conn = get_db_connection()
-    if not conn:
-        return False
-
+def get_posted_ids(trakt_ids):
+    """Return the subset of trakt_ids already posted (None on error)"""
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM posted_history WHERE trakt_id = %s", (trakt_id,))
-        result = cur.fetchone() is not None
-        cur.close()
-        conn.close()
-        return result
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT trakt_id FROM posted_history WHERE trakt_id = ANY(%s)",
+                    (list(trakt_ids),),
+                )
+                return {row[0] for row in cur.fetchall()}
     except Exception as e:
         logger.error(f"Error checking posted status: {e}")
-        return False
+        return None
 
 
-def mark_as_posted(trakt_id):
-    """Mark item as posted"""
-    conn = get_db_connection()
-    if not conn:
-        return False
+def mark_as_posted(trakt_ids, cursor=None):
+    """Mark items as posted and advance the history cursor in one transaction"""
+    global trakt_cursor
+
+    if cursor == trakt_cursor:
+        cursor = None
+    if not trakt_ids and not cursor:
+        return True
 
     try:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO posted_history (trakt_id) VALUES (%s) ON CONFLICT (trakt_id) DO NOTHING",
-            (trakt_id,),
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                if trakt_ids:
+                    execute_values(
+                        cur,
+                        "INSERT INTO posted_history (trakt_id) VALUES %s ON CONFLICT (trakt_id) DO NOTHING",
+                        [(trakt_id,) for trakt_id in trakt_ids],
+                        page_size=500,
+                    )
+                if cursor:
+                    cur.execute(
+                        "UPDATE trakt_tokens SET trakt_cursor = %s WHERE id = 1",
+                        (cursor,),
+                    )
+            conn.commit()
+
+        if cursor:
+            trakt_cursor = cursor
         return True
     except Exception as e:
         logger.error(f"Error marking as posted: {e}")
@@ -295,23 +474,20 @@ def mark_as_posted(trakt_id):
 
 
 def cleanup_old_entries():
-    """Clean up entries older than 30 days to keep database lean"""
-    conn = get_db_connection()
-    if not conn:
-        return
-
+    """Clean up entries older than MAX_CATCHUP_DAYS to keep database lean"""
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            DELETE FROM posted_history 
-            WHERE posted_at < NOW() - INTERVAL '30 days'
-        """
-        )
-        deleted = cur.rowcount
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                # Must match the fetch window, or old watches could be reposted
+                cur.execute(
+                    """
+                    DELETE FROM posted_history 
+                    WHERE posted_at < NOW() - make_interval(days => %s)
+                """,
+                    (MAX_CATCHUP_DAYS,),
+                )
+                deleted = cur.rowcount
+            conn.commit()
         if deleted > 0:
             logger.info(f"🧹 Cleaned up {deleted} old entries")
     except Exception as e:
@@ -319,39 +495,129 @@ def cleanup_old_entries():
 
 
 def get_trakt_history():
-    """Fetch watch history from Trakt"""
+    """Fetch watch history from Trakt, with the response's cache validators"""
     global current_access_token
 
-    since = datetime.now(timezone.utc) - timedelta(hours=LOOKBACK_HOURS)
-    since_iso = since.isoformat().replace("+00:00", "Z")
+    # Resume from the last handled watch (inclusive - items sharing its
+    # timestamp are deduped against posted history); fall back to the
+    # lookback window until a cursor has been saved
+    now = datetime.now(timezone.utc)
+    if trakt_cursor:
+        since = max(trakt_cursor, now - timedelta(days=MAX_CATCHUP_DAYS))
+        since = since.astimezone(timezone.utc)
+    else:
+        since = now - timedelta(hours=LOOKBACK_HOURS)
+    since_iso = since.isoformat(timespec="milliseconds").replace("+00:00", "Z")
 
     url = f"https://api.trakt.tv/users/me/history?start_at={since_iso}&limit=50"
 
-    headers = {
-        "Content-Type": "application/json",
-        "trakt-api-version": "2",
-        "trakt-api-key": TRAKT_CLIENT_ID,
+    auth_headers = {
+        **TRAKT_HEADERS,
         "Authorization": f"Bearer {current_access_token}",
     }
 
-    logger.info(f"🔍 Fetching Trakt history (last {LOOKBACK_HOURS} hours)")
+    # Conditional GET - Trakt answers 304 with no body when nothing changed
+    headers = dict(auth_headers)
+    if trakt_etag:
+        headers["If-None-Match"] = trakt_etag
+    if trakt_last_modified:
+        headers["If-Modified-Since"] = trakt_last_modified
+
+    logger.info(f"🔍 Fetching Trakt history since {since_iso}")
 
     try:
-        response = requests.get(url, headers=headers, timeout=15)
+        response = SESSION.get(url, headers=headers, timeout=15)
 
         # If we get 401, try refreshing token
         if response.status_code == 401:
             logger.warning("⚠️  Got 401 Unauthorized - attempting token refresh...")
             if refresh_trakt_token():
                 # Retry with new token
-                headers["Authorization"] = f"Bearer {current_access_token}"
-                response = requests.get(url, headers=headers, timeout=15)
+                auth_headers["Authorization"] = f"Bearer {current_access_token}"
+                headers["Authorization"] = auth_headers["Authorization"]
+                response = SESSION.get(url, headers=headers, timeout=15)
+
+        if response.status_code == 304:
+            logger.info("📭 Trakt history unchanged since last check")
+            return [], None
 
         response.raise_for_status()
-        return response.json()
+        validators = (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+        history = orjson.loads(response.content)
+
+        # Trakt returns newest first, one page at a time; fetch every page so
+        # the cursor can't move past watches that didn't fit on the first one
+        page_count = int(response.headers.get("X-Pagination-Page-Count", 1))
+        seen_ids = {item["id"] for item in history}
+        for page in range(2, page_count + 1):
+            response = SESSION.get(
+                f"{url}&page={page}", headers=auth_headers, timeout=15
+            )
+            response.raise_for_status()
+
+            # A watch logged mid-fetch shifts items onto the next page
+            for item in orjson.loads(response.content):
+                if item["id"] not in seen_ids:
+                    seen_ids.add(item["id"])
+                    history.append(item)
+
+        return history, validators
     except Exception as e:
         logger.error(f"❌ Trakt API error: {e}")
-        return []
+        return [], None
+
+
+def save_history_validators(etag, last_modified):
+    """Remember Trakt history validators in memory and in the database"""
+    global trakt_etag, trakt_last_modified
+
+    if (etag, last_modified) == (trakt_etag, trakt_last_modified):
+        return
+
+    trakt_etag = etag
+    trakt_last_modified = last_modified
+
+    try:
+        with db_conn() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE trakt_tokens
+                    SET history_etag = %s, history_last_modified = %s
+                    WHERE id = 1
+                """,
+                    (etag, last_modified),
+                )
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Error saving history validators: {e}")
+
+
+@cached(TMDB_CACHE, key=partial(hashkey, "movie"), lock=TMDB_CACHE_LOCK)
+def _fetch_tmdb_movie(tmdb_id):
+    """Fetch movie details from TMDB (cached; None if TMDB rejects it)"""
+    url = f"{TMDB_API_URL}/movie/{tmdb_id}"
+    response = SESSION.get(url, params=TMDB_CREDITS_PARAMS, timeout=10)
+    return orjson.loads(response.content) if response.ok else None
+
+
+@cached(TMDB_CACHE, key=partial(hashkey, "show"), lock=TMDB_CACHE_LOCK)
+def _fetch_tmdb_show(show_id):
+    """Fetch show details from TMDB (cached; None if TMDB rejects it)"""
+    url = f"{TMDB_API_URL}/tv/{show_id}"
+    response = SESSION.get(url, params=TMDB_PARAMS, timeout=10)
+    return orjson.loads(response.content) if response.ok else None
+
+
+@cached(TMDB_CACHE, key=partial(hashkey, "episode"), lock=TMDB_CACHE_LOCK)
+def _fetch_tmdb_episode(show_id, season, episode):
+    """Fetch episode details from TMDB (cached; None if TMDB rejects it)"""
+    url = f"{TMDB_API_URL}/tv/{show_id}/season/{season}/episode/{episode}"
+    response = SESSION.get(url, params=TMDB_CREDITS_PARAMS, timeout=10)
+    return orjson.loads(response.content) if response.ok else None
 
 
 def fetch_tmdb_movie(tmdb_id):
@@ -360,13 +626,10 @@ def fetch_tmdb_movie(tmdb_id):
         return None
 
     try:
-        url = f"https://api.themoviedb.org/3/movie/{tmdb_id}?api_key={TMDB_API_KEY}&append_to_response=credits"
-        response = requests.get(url, timeout=10)
-        if response.ok:
-            return response.json()
-    except Exception as e:
+        return _fetch_tmdb_movie(tmdb_id)
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"TMDB movie error: {e}")
-    return None
+        return None
 
 
 def fetch_tmdb_episode(show_id, season, episode):
@@ -375,76 +638,79 @@ def fetch_tmdb_episode(show_id, season, episode):
         return None
 
     try:
-        show_url = f"https://api.themoviedb.org/3/tv/{show_id}?api_key={TMDB_API_KEY}"
-        show_res = requests.get(show_url, timeout=10)
-        show_data = show_res.json() if show_res.ok else {}
-
-        ep_url = f"https://api.themoviedb.org/3/tv/{show_id}/season/{season}/episode/{episode}?api_key={TMDB_API_KEY}&append_to_response=credits"
-        ep_res = requests.get(ep_url, timeout=10)
-        if ep_res.ok:
-            ep_data = ep_res.json()
-            ep_data["show_poster"] = show_data.get("poster_path")
-
-            # Add network information
-            networks = show_data.get("networks", [])
-            if networks:
-                ep_data["show_network"] = networks[0]["name"]
-
-            # Add guest stars from credits
-            if ep_data.get("credits") and ep_data["credits"].get("guest_stars"):
-                ep_data["guest_stars"] = ep_data["credits"]["guest_stars"]
-
-            return ep_data
-    except Exception as e:
+        # Show and episode lookups are independent, so run them together
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            show_future = executor.submit(_fetch_tmdb_show, show_id)
+            ep_future = executor.submit(_fetch_tmdb_episode, show_id, season, episode)
+
+            try:
+                show_data = show_future.result() or {}
+            except requests.RequestException:
+                show_data = {}
+
+            ep_data = ep_future.result()
+
+        if ep_data is None:
+            return None
+
+        # Copy so the cached response is never modified
+        ep_data = dict(ep_data)
+        ep_data["show_poster"] = show_data.get("poster_path")
+
+        # Add network information
+        networks = show_data.get("networks") or []
+        if networks and networks[0].get("name"):
+            ep_data["show_network"] = networks[0]["name"]
+
+        # Add guest stars from credits
+        if ep_data.get("credits") and ep_data["credits"].get("guest_stars"):
+            ep_data["guest_stars"] = ep_data["credits"]["guest_stars"]
+
+        return ep_data
+    except (requests.RequestException, ValueError) as e:
         logger.error(f"TMDB episode error: {e}")
+        return None
+
+
+def fetch_tmdb_for_item(item):
+    """Fetch TMDB details for a Trakt history item (None if unavailable)"""
+    # TMDB data is optional, so a malformed response must never stop posting
+    try:
+        if item["type"] == "movie":
+            tmdb_id = (item["movie"].get("ids") or {}).get("tmdb")
+            if tmdb_id:
+                return fetch_tmdb_movie(tmdb_id)
+        elif item["type"] == "episode":
+            tmdb_id = (item["show"].get("ids") or {}).get("tmdb")
+            episode = item["episode"]
+            if tmdb_id:
+                return fetch_tmdb_episode(
+                    tmdb_id, episode["season"], episode["number"]
+                )
+    except Exception as e:
+        logger.error(f"TMDB lookup error for item {item.get('id')}: {e}")
     return None
 
 
+def parse_trakt_timestamp(value):
+    """Parse a Trakt timestamp (e.g. 2024-01-31T18:30:00.000Z) as aware UTC"""
+    # Python 3.11+ parses the trailing "Z" as UTC directly
+    return datetime.fromisoformat(value)
+
+
 def get_color_from_rating(rating):
     """Get Discord embed color based on rating"""
     if not rating:
         return 0x5865F2  # Discord Blurple
-    if rating >= 9:
-        return 0x00D9FF  # Brilliant Cyan
-    if rating >= 8:
-        return 0x00FF88  # Vibrant Green
-    if rating >= 7.5:
-        return 0xFFD700  # Gold
-    if rating >= 7:
-        return 0xFFA500  # Orange
-    if rating >= 6:
-        return 0xFF6B9D  # Pink
-    if rating >= 5:
-        return 0xFF69B4  # Hot Pink
-    return 0xFF4444  # Red
+    return RATING_COLORS[bisect_right(RATING_THRESHOLDS, rating)]
 
 
 def get_movie_color(genres):
     """Get color based on movie genre"""
-    if not genres:
-        return 0x9B59B6  # Purple
-
-    genre_colors = {
-        "Action": 0xFF4444,
-        "Adventure": 0xFF8C00,
-        "Animation": 0xFF69B4,
-        "Comedy": 0xFFD700,
-        "Crime": 0x8B0000,
-        "Documentary": 0x4682B4,
-        "Drama": 0x9370DB,
-        "Fantasy": 0x9400D3,
-        "Horror": 0x8B0000,
-        "Mystery": 0x483D8B,
-        "Romance": 0xFF1493,
-        "Sci-Fi": 0x00CED1,
-        "Thriller": 0xDC143C,
-    }
-
-    for genre in genres:
-        if genre["name"] in genre_colors:
-            return genre_colors[genre["name"]]
-
-    return 0x9B59B6  # Default purple
+    return next(
+        (GENRE_COLORS[g["name"]] for g in genres or () if g["name"] in GENRE_COLORS),
+        0x9B59B6,  # Default purple
+    )
 
 
 def get_show_color():
@@ -452,17 +718,13 @@ def get_show_color():
     return 0x00D9FF  # Electric cyan for TV shows
 
 
-def post_movie_to_discord(item):
-    """Post movie watch to Discord"""
+def build_movie_embed(item, tmdb_data=None):
+    """Build the Discord embed for a movie watch"""
     movie = item["movie"]
-    watched_at = datetime.strptime(item["watched_at"], "%Y-%m-%dT%H:%M:%S.%fZ")
-    watched_at = watched_at.replace(tzinfo=timezone.utc)
+    slug = movie["ids"]["slug"]
+    watched_at = parse_trakt_timestamp(item["watched_at"])
     watched_at_ist = watched_at.astimezone(IST)
 
-    tmdb_data = None
-    if movie.get("ids", {}).get("tmdb"):
-        tmdb_data = fetch_tmdb_movie(movie["ids"]["tmdb"])
-
     # Build description
     description = ""
     if tmdb_data and tmdb_data.get("tagline"):
@@ -487,39 +749,28 @@ def post_movie_to_discord(item):
         embed_color = get_movie_color(tmdb_data["genres"])
 
     embed = {
-        "author": {
-            "name": "Movie 🎬",
-            "icon_url": "https://i.ibb.co/6JbfjSKn/Trakt-TV.png",
-        },
-        "title": f"{movie['title']}",
+        **MOVIE_EMBED,
+        "title": movie["title"],
         "description": description,
         "color": embed_color,
-        "url": f"https://trakt.tv/movies/{movie['ids']['slug']}",
+        "url": TRAKT_URL + "/movies/" + slug,
         "fields": [],
-        "footer": {
-            "text": "Trakt  •  Infuse",
-            "icon_url": "https://i.ibb.co/6JbfjSKn/Trakt-TV.png",
-        },
         "timestamp": watched_at.isoformat(),
     }
 
     # Add poster and backdrop
     if tmdb_data:
         if tmdb_data.get("poster_path"):
-            embed["thumbnail"] = {
-                "url": f"https://image.tmdb.org/t/p/w500{tmdb_data['poster_path']}"
-            }
+            embed["thumbnail"] = {"url": TMDB_W500 + tmdb_data["poster_path"]}
         if tmdb_data.get("backdrop_path"):
-            embed["image"] = {
-                "url": f"https://image.tmdb.org/t/p/original{tmdb_data['backdrop_path']}"
-            }
+            embed["image"] = {"url": TMDB_ORIGINAL + tmdb_data["backdrop_path"]}
 
     # Build fields
     # Row 1: Watch time
     embed["fields"].append(
         {
             "name": "🕐 Watched",
-            "value": watched_at_ist.strftime("%b %d, %Y at %I:%M %p IST"),
+            "value": watched_at_ist.strftime(WATCHED_FORMAT),
             "inline": False,
         }
     )
@@ -587,23 +838,17 @@ def post_movie_to_discord(item):
             {"name": "💰 Budget", "value": budget_str, "inline": True}
         )
 
-    send_to_discord({"embeds": [embed]})
+    return embed
 
 
-def post_episode_to_discord(item):
-    """Post episode watch to Discord"""
+def build_episode_embed(item, tmdb_data=None):
+    """Build the Discord embed for an episode watch"""
     show = item["show"]
     episode = item["episode"]
-    watched_at = datetime.strptime(item["watched_at"], "%Y-%m-%dT%H:%M:%S.%fZ")
-    watched_at = watched_at.replace(tzinfo=timezone.utc)
+    slug = show["ids"]["slug"]
+    watched_at = parse_trakt_timestamp(item["watched_at"])
     watched_at_ist = watched_at.astimezone(IST)
 
-    tmdb_data = None
-    if show.get("ids", {}).get("tmdb"):
-        tmdb_data = fetch_tmdb_episode(
-            show["ids"]["tmdb"], episode["season"], episode["number"]
-        )
-
     # Build description with episode name
     description = f"**S{episode['season']:02d}E{episode['number']:02d}"
     if episode.get("title"):
@@ -629,38 +874,29 @@ def post_episode_to_discord(item):
         embed_color = get_color_from_rating(tmdb_data["vote_average"])
 
     embed = {
-        "author": {
-            "name": f"{show['title']} 📺",
-        },
-        "title": episode.get("title", f"Episode {episode['number']}"),
+        **EPISODE_EMBED,
+        "author": {"name": f"{show['title']} 📺"},
+        "title": episode.get("title") or f"Episode {episode['number']}",
         "description": description,
         "color": embed_color,
-        "url": f"https://trakt.tv/shows/{show['ids']['slug']}/seasons/{episode['season']}/episodes/{episode['number']}",
+        "url": f"{TRAKT_URL}/shows/{slug}/seasons/{episode['season']}/episodes/{episode['number']}",
         "fields": [],
-        "footer": {
-            "text": "Trakt  •  Infuse",
-            "icon_url": "https://i.ibb.co/6JbfjSKn/Trakt-TV.png",
-        },
         "timestamp": watched_at.isoformat(),
     }
 
     # Add images
     if tmdb_data:
         if tmdb_data.get("show_poster"):
-            embed["thumbnail"] = {
-                "url": f"https://image.tmdb.org/t/p/w500{tmdb_data['show_poster']}"
-            }
+            embed["thumbnail"] = {"url": TMDB_W500 + tmdb_data["show_poster"]}
         if tmdb_data.get("still_path"):
-            embed["image"] = {
-                "url": f"https://image.tmdb.org/t/p/original{tmdb_data['still_path']}"
-            }
+            embed["image"] = {"url": TMDB_ORIGINAL + tmdb_data["still_path"]}
 
     # Build fields
     # Row 1: Watch time
     embed["fields"].append(
         {
             "name": "🕐 Watched",
-            "value": watched_at_ist.strftime("%b %d, %Y at %I:%M %p IST"),
+            "value": watched_at_ist.strftime(WATCHED_FORMAT),
             "inline": False,
         }
     )
@@ -719,22 +955,91 @@ def post_episode_to_discord(item):
                 {"name": "⭐ Guest Stars", "value": guest_names, "inline": False}
             )
 
-    send_to_discord({"embeds": [embed]})
+    return embed
+
+
+def embed_length(embed):
+    """Count the characters Discord applies to its per-message embed limit"""
+    return (
+        len(embed.get("title") or "")
+        + len(embed.get("description") or "")
+        + len((embed.get("author") or {}).get("name") or "")
+        + len((embed.get("footer") or {}).get("text") or "")
+        + sum(
+            len(f.get("name") or "") + len(f.get("value") or "")
+            for f in embed.get("fields") or []
+        )
+    )
+
+
+def batch_embeds(pending):
+    """Group (trakt_id, embed) pairs into batches one webhook message can hold"""
+    batch = []
+    batch_length = 0
+    for trakt_id, embed in pending:
+        length = embed_length(embed)
+        if batch and (
+            len(batch) == DISCORD_MAX_EMBEDS
+            or batch_length + length > DISCORD_MAX_EMBED_CHARS
+        ):
+            yield batch
+            batch = []
+            batch_length = 0
+        batch.append((trakt_id, embed))
+        batch_length += length
+    if batch:
+        yield batch
 
 
 def send_to_discord(payload):
-    """Send embed to Discord"""
+    """Send embeds to Discord; returns (status, reset_after, remaining)
+
+    status is the HTTP status code, or None if the request itself failed.
+    """
     try:
-        response = requests.post(DISCORD_WEBHOOK_URL, json=payload, timeout=10)
+        body = orjson.dumps(payload)
+        response = SESSION.post(
+            DISCORD_WEBHOOK_URL, data=body, headers=JSON_HEADERS, timeout=10
+        )
+
         if response.ok:
             logger.info("✅ Posted to Discord")
-            return True
         else:
             logger.error(f"❌ Discord webhook failed: {response.status_code}")
-            return False
+
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_after = float(response.headers.get("X-RateLimit-Reset-After", 0))
+        return (
+            response.status_code,
+            reset_after,
+            int(remaining) if remaining is not None else None,
+        )
     except Exception as e:
         logger.error(f"❌ Discord error: {e}")
-        return False
+        return None, 0.0, None
+
+
+def send_embeds(batch):
+    """Post a batch of (trakt_id, embed) pairs as one message; returns the status"""
+    status, reset_after, remaining = send_to_discord(
+        {"embeds": [embed for _, embed in batch]}
+    )
+
+    # Only pause when Discord says the webhook's bucket is empty
+    if remaining == 0 and reset_after > 0:
+        logger.info("⏳ Discord rate limit reached, waiting %.2fs", reset_after)
+        time.sleep(reset_after)
+
+    return status
+
+
+def is_rejected(status):
+    """True when Discord refused the payload itself (invalid or too large)
+
+    Other 4xx responses (401/403/404) mean the webhook is broken, not the
+    embeds, so those are retried rather than dropped.
+    """
+    return status in (400, 413)
 
 
 def check_and_post():
@@ -756,70 +1061,173 @@ def check_and_post():
     # Ensure token is valid before making API calls
     ensure_valid_token()
 
-    history = get_trakt_history()
-    logger.info(f"📊 Found {len(history)} recent watch events")
+    history, validators = get_trakt_history()
+    logger.info("📊 Found %d recent watch events", len(history))
 
     if not history:
         logger.info("No new watches found")
+    elif not post_new_items(history):
         return
 
-    new_count = 0
+    # Only remember this response once every item in it has been handled
+    if validators:
+        save_history_validators(*validators)
+
+
+def get_history_cursor(history, handled_ids):
+    """Return the newest watched_at with every item up to and at it handled"""
+    cursor = trakt_cursor
+    for watched_at, items in groupby(reversed(history), itemgetter("watched_at")):
+        if any(item["id"] not in handled_ids for item in items):
+            break
+        cursor = parse_trakt_timestamp(watched_at)
+    return cursor
+
+
+def post_new_items(history):
+    """Post history items that haven't been posted yet
 
+    Returns False when anything is left to retry (DB errors, failed items
+    or batches) so the caller keeps asking Trakt for the full history.
+    """
     # Process history (reverse to post oldest first)
-    for item in reversed(history):
-        trakt_id = item["id"]
+    already_posted = get_posted_ids(item["id"] for item in history)
+    if already_posted is None:
+        logger.error("❌ Could not read posted history - skipping this check")
+        return False
+
+    new_items = [
+        item for item in reversed(history) if item["id"] not in already_posted
+    ]
+
+    if not new_items:
+        logger.info("No new watches found")
+        return mark_as_posted([], get_history_cursor(history, already_posted))
 
-        if is_posted(trakt_id):
-            continue
+    new_count = 0
+    posted_ids = []
+    all_handled = True
+
+    pending = []
+
+    # Fetch TMDB details concurrently; embeds keep watch order
+    with ThreadPoolExecutor(max_workers=TMDB_WORKERS) as executor:
+        tmdb_results = list(executor.map(fetch_tmdb_for_item, new_items))
+
+    for item, tmdb_data in zip(new_items, tmdb_results):
+        trakt_id = item["id"]
 
         try:
             if item["type"] == "movie":
                 logger.info(
-                    f"🎬 New: {item['movie']['title']} ({item['movie'].get('year')})"
+                    "🎬 New: %s (%s)", item["movie"]["title"], item["movie"].get("year")
                 )
-                post_movie_to_discord(item)
-                new_count += 1
+                pending.append((trakt_id, build_movie_embed(item, tmdb_data)))
             elif item["type"] == "episode":
                 logger.info(
-                    f"📺 New: {item['show']['title']} S{item['episode']['season']}E{item['episode']['number']}"
+                    "📺 New: %s S%sE%s",
+                    item["show"]["title"],
+                    item["episode"]["season"],
+                    item["episode"]["number"],
                 )
-                post_episode_to_discord(item)
-                new_count += 1
-
-            mark_as_posted(trakt_id)
-            time.sleep(0.5)
+                pending.append((trakt_id, build_episode_embed(item, tmdb_data)))
+            else:
+                # Nothing to post for other history types
+                posted_ids.append(trakt_id)
 
         except Exception as e:
-            logger.error(f"Error processing item: {e}")
+            logger.error("Error processing item: %s", e)
+            all_handled = False
+
+    # Send up to DISCORD_MAX_EMBEDS embeds per webhook message
+    retry_later = False
+    for batch in batch_embeds(pending):
+        status = send_embeds(batch)
+
+        # One invalid embed fails the whole message - send them one by one
+        # (lazily, so sending still stops at the first failure)
+        if is_rejected(status) and len(batch) > 1:
+            results = ((pair, send_embeds([pair])) for pair in batch)
+        else:
+            results = ((pair, status) for pair in batch)
+
+        for (trakt_id, _), status in results:
+            if 200 <= (status or 0) < 300:
+                posted_ids.append(trakt_id)
+                new_count += 1
+            elif is_rejected(status):
+                # Retrying won't help; drop it so it can't block later items
+                logger.error("❌ Discord rejected item %s - skipping it", trakt_id)
+                posted_ids.append(trakt_id)
+            else:
+                # Server or network error - stop so newer items never post
+                # ahead of this one; everything left retries next check
+                retry_later = True
+                break
+
+        if retry_later:
+            all_handled = False
+            break
+
+    logger.info("✨ Posted %d new item(s)!", new_count)
+
+    handled_ids = already_posted.union(posted_ids)
+    saved = mark_as_posted(posted_ids, get_history_cursor(history, handled_ids))
+    return saved and all_handled
+
+
+def run_check():
+    """Run a check unless the previous one is still in progress"""
+    if not CHECK_LOCK.acquire(blocking=False):
+        logger.warning("⏳ Previous check still running, skipping this one")
+        return
 
-    logger.info(f"✨ Posted {new_count} new item(s)!")
+    try:
+        check_and_post()
+    except Exception as e:
+        logger.exception(f"❌ Unexpected error: {e}")
+    finally:
+        CHECK_LOCK.release()
 
 
 def main():
     """Main loop"""
     logger.info("🚀 Trakt Watch History Tracker started!")
     logger.info(f"📅 Checking every {CHECK_INTERVAL} seconds")
-    logger.info(f"🕐 Looking back {LOOKBACK_HOURS} hours for new watches")
+    logger.info(
+        f"🕐 Looking back {LOOKBACK_HOURS} hours until a history cursor is saved"
+    )
 
     # Initialize database
     if not init_database():
         logger.error("Failed to initialize database. Exiting.")
         return
 
-    # Run cleanup on startup
-    cleanup_old_entries()
-
-    # Ensure we have valid tokens
+    # Load tokens once; checks only compare against the cached expiry
+    load_tokens()
     ensure_valid_token()
 
-    while True:
-        try:
-            check_and_post()
-        except Exception as e:
-            logger.exception(f"❌ Unexpected error: {e}")
+    last_cleanup = None
+    next_run = time.monotonic()
 
-        logger.info(f"⏰ Next check in {CHECK_INTERVAL} seconds...")
-        time.sleep(CHECK_INTERVAL)
+    while True:
+        # Prune old posted history on startup, then once a day
+        if last_cleanup is None or time.monotonic() - last_cleanup >= CLEANUP_SECONDS:
+            cleanup_old_entries()
+            last_cleanup = time.monotonic()
+
+        # Checks run in the background so a slow one never delays the schedule
+        CHECK_EXECUTOR.submit(run_check)
+
+        # Schedule against a fixed monotonic timeline so the period never drifts;
+        # after a long stall, skip the missed slots instead of catching up
+        now = time.monotonic()
+        next_run += CHECK_INTERVAL
+        if next_run <= now:
+            next_run += ((now - next_run) // CHECK_INTERVAL + 1) * CHECK_INTERVAL
+        delay = next_run - now
+        logger.info(f"⏰ Next check in {delay:.0f} seconds...")
+        time.sleep(delay)
 
 
 if __name__ == "__main__":